@@ -1,17 +1,29 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from pymongo import MongoClient
-from datetime import datetime
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from motor.motor_asyncio import AsyncIOMotorClient
+from datetime import datetime, timedelta
 import math
 import asyncio
-import json
+import orjson
+from contextlib import asynccontextmanager
 from typing import List, Optional
 import os
 from bson import ObjectId
 
-app = FastAPI(title="Growth Pattern API Gateway")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Motor connects lazily; ping once so the driver starts monitoring the topology
+    # that /health reads, without depending on another startup operation
+    try:
+        await client.admin.command("ping")
+    except Exception as e:
+        print(f"Warning: Failed to reach MongoDB: {e}")
+    await create_indexes()
+    yield
+
+app = FastAPI(title="Growth Pattern API Gateway", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -24,15 +36,45 @@ app.add_middleware(
 
 # MongoDB connection
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://mongodb:27017/")
-client = MongoClient(MONGO_URL)
+client = AsyncIOMotorClient(MONGO_URL, maxPoolSize=50, minPoolSize=5, serverSelectionTimeoutMS=2000)
 db = client["growth_calculator"]
 events_collection = db["calculation_events"]
 calculations_collection = db["calculations"]
 
+# Server-Sent Events framing
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+
+def sse_frame(data: dict) -> bytes:
+    """Serialize a payload as a single SSE data frame"""
+    return _SSE_PREFIX + orjson.dumps(data) + _SSE_SUFFIX
+
+def growth_steps(base: float, exponent: int):
+    """
+    Yield the linear (B × i) and exponential (B^i) results for i = 1..exponent.
+    The exponential result is a running product of the previous step; like
+    math.pow, it raises OverflowError once a result is out of float range.
+    """
+    exp_acc = 1.0
+    for i in range(1, exponent + 1):
+        exp_acc *= base
+        if math.isinf(exp_acc):
+            raise OverflowError("math range error")
+        yield base * i, exp_acc
+
+def growth_sequences(base: float, exponent: int):
+    """Compute every linear and exponential step for i = 1..exponent"""
+    linear_results = []
+    exponential_results = []
+    for linear_result, exponential_result in growth_steps(base, exponent):
+        linear_results.append(linear_result)
+        exponential_results.append(exponential_result)
+    return linear_results, exponential_results
+
 # Request/Response Models
 class CalculationRequest(BaseModel):
-    base: float
-    exponent: int
+    base: float = Field(gt=0)
+    exponent: int = Field(gt=0, le=100)
 
 class StepLog(BaseModel):
     step: int
@@ -60,15 +102,41 @@ class EventLog(BaseModel):
     timestamp: str
     data: Optional[dict] = None
 
+async def create_indexes():
+    """Create the indexes used by the event and calculation queries"""
+    try:
+        await events_collection.create_index([("calculation_id", 1), ("timestamp", 1)])
+        await events_collection.create_index([("timestamp", -1)])
+        await calculations_collection.create_index([("started_at", -1)])
+    except Exception as e:
+        print(f"Warning: Failed to create indexes: {e}")
+
+def database_connected() -> bool:
+    """
+    Check for a writable MongoDB server using the driver's cached topology (no network I/O).
+    Relies on the startup ping in lifespan() having opened the topology.
+    """
+    server_descriptions = client.topology_description.server_descriptions()
+    return any(sd.is_writable for sd in server_descriptions.values())
+
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
         "service": "api-gateway-python",
-        "database": "connected" if client.server_info() else "disconnected",
+        "database": "connected" if database_connected() else "disconnected",
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe that confirms MongoDB answers a ping"""
+    try:
+        await client.admin.command("ping")
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+    return {"status": "ready", "service": "api-gateway-python"}
+
 @app.post("/api/calculate/stream")
 async def calculate_growth_stream(request: CalculationRequest):
     """
@@ -77,15 +145,6 @@ async def calculate_growth_stream(request: CalculationRequest):
     """
     async def generate_calculation_events():
         try:
-            # Validate input
-            if request.base <= 0:
-                yield f"data: {json.dumps({'type': 'error', 'error': 'Base must be positive'})}\n\n"
-                return
-            
-            if request.exponent <= 0 or request.exponent > 100:
-                yield f"data: {json.dumps({'type': 'error', 'error': 'Exponent must be between 1 and 100'})}\n\n"
-                return
-            
             # Create calculation record
             started_at = datetime.utcnow()
             calculation_doc = {
@@ -95,89 +154,97 @@ async def calculate_growth_stream(request: CalculationRequest):
                 "started_at": started_at,
                 "completed_at": None
             }
-            calc_result = calculations_collection.insert_one(calculation_doc)
-            calculation_id = str(calc_result.inserted_id)
+            calc_result = await calculations_collection.insert_one(calculation_doc)
+            calc_oid = calc_result.inserted_id
+            calculation_id = str(calc_oid)
             
             # Send start event
-            start_event = json.dumps({
+            yield sse_frame({
                 'type': 'start',
                 'calculation_id': calculation_id,
                 'base': request.base,
                 'exponent': request.exponent
             })
-            yield f"data: {start_event}\n\n"
             
-            log_event(calculation_id, "calculation_started", 
-                     f"Starting calculation: base={request.base}, exponent={request.exponent}",
-                     {"base": request.base, "exponent": request.exponent})
+            try:
+                await log_event(calculation_id, "calculation_started", 
+                         f"Starting calculation: base={request.base}, exponent={request.exponent}",
+                         {"base": request.base, "exponent": request.exponent})
+            except Exception as e:
+                print(f"Warning: Failed to log event: {e}")
             
             # Small delay to ensure start event is sent
             await asyncio.sleep(0.1)
             
-            # Perform calculations step by step with 1-second delay
-            for i in range(1, request.exponent + 1):
-                # Linear calculation
-                linear_result = request.base * i
-                
-                # Exponential calculation
-                exponential_result = math.pow(request.base, i)
-                
-                # Send step event
-                step_data = {
-                    'type': 'step',
-                    'step': i,
-                    'linear': {
-                        'operation': f"{request.base} × {i}",
-                        'result': linear_result
-                    },
-                    'exponential': {
-                        'operation': f"{request.base}^{i}",
-                        'result': exponential_result
-                    },
-                    'timestamp': datetime.utcnow().isoformat()
-                }
-                
-                yield f"data: {json.dumps(step_data)}\n\n"
-                
-                # Log to database (async to not block streaming)
-                try:
-                    log_event(calculation_id, "linear_step", 
-                             f"Step {i}: {request.base} × {i} = {linear_result}",
-                             {"step": i, "result": linear_result, "type": "linear"})
+            # Perform every calculation step and serialize its event up front
+            steps = []
+            frames = []
+            overflow_error = None
+            steps_started_at = datetime.utcnow()
+            base_str = repr(request.base)
+            try:
+                for i, (linear_result, exponential_result) in enumerate(
+                        growth_steps(request.base, request.exponent), start=1):
+                    # Steps are emitted on a fixed 1-second cadence
+                    step_timestamp = steps_started_at + timedelta(seconds=i - 1)
+                    
+                    step = {
+                        'step': i,
+                        'linear': {
+                            'operation': f"{base_str} × {i}",
+                            'result': linear_result
+                        },
+                        'exponential': {
+                            'operation': f"{base_str}^{i}",
+                            'result': exponential_result
+                        },
+                        'timestamp': step_timestamp
+                    }
                     
-                    log_event(calculation_id, "exponential_step",
-                             f"Step {i}: {request.base}^{i} = {exponential_result}",
-                             {"step": i, "result": exponential_result, "type": "exponential"})
-                except Exception as e:
-                    print(f"Warning: Failed to log event: {e}")
-                
-                # Wait 1 second before next step (like C++ app)
+                    # Keep the step for the calculation record, written once on completion
+                    steps.append(step)
+                    frames.append(sse_frame({**step, 'type': 'step', 'timestamp': step_timestamp.isoformat()}))
+            except OverflowError as e:
+                # Stream the steps computed before the overflow, then report the error
+                overflow_error = e
+            
+            # Send step events with 1-second delay (like C++ app)
+            for frame in frames:
+                yield frame
                 await asyncio.sleep(1)
             
+            if overflow_error:
+                raise overflow_error
+            
             # Final results
-            linear_final = request.base * request.exponent
-            exponential_final = math.pow(request.base, request.exponent)
+            linear_final = steps[-1]['linear']['result']
+            exponential_final = steps[-1]['exponential']['result']
             
             # Update calculation record
             completed_at = datetime.utcnow()
-            try:
+            # The two writes touch different collections, so issue them concurrently
+            update_result, event_result = await asyncio.gather(
                 calculations_collection.update_one(
-                    {"_id": ObjectId(calculation_id)},
+                    {"_id": calc_oid},
                     {
                         "$set": {
                             "status": "completed",
                             "completed_at": completed_at,
                             "linear_result": linear_final,
                             "exponential_result": exponential_final,
-                            "total_steps": request.exponent
+                            "total_steps": request.exponent,
+                            "steps": steps
                         }
                     }
-                )
-                
+                ),
                 log_event(calculation_id, "calculation_completed",
-                         "Calculation completed successfully")
-            except Exception as e:
-                print(f"Warning: Failed to update calculation: {e}")
+                          "Calculation completed successfully"),
+                return_exceptions=True
+            )
+            if isinstance(update_result, Exception):
+                print(f"Warning: Failed to update calculation: {update_result}")
+            if isinstance(event_result, Exception):
+                print(f"Warning: Failed to log event: {event_result}")
             
             # Send completion event
             completion_data = {
@@ -190,14 +257,14 @@ async def calculate_growth_stream(request: CalculationRequest):
                 'completed_at': completed_at.isoformat()
             }
             
-            yield f"data: {json.dumps(completion_data)}\n\n"
+            yield sse_frame(completion_data)
             
         except Exception as e:
             error_data = {'type': 'error', 'message': str(e)}
-            yield f"data: {json.dumps(error_data)}\n\n"
+            yield sse_frame(error_data)
             if 'calculation_id' in locals():
                 try:
-                    log_event(calculation_id, "calculation_error", f"Error: {str(e)}", {"error": str(e)})
+                    await log_event(calculation_id, "calculation_error", f"Error: {str(e)}", {"error": str(e)})
                 except:
                     pass
     
@@ -212,7 +279,7 @@ async def calculate_growth_stream(request: CalculationRequest):
         }
     )
 
-@app.post("/api/calculate", response_model=CalculationResponse)
+@app.post("/api/calculate", response_model=CalculationResponse, response_class=ORJSONResponse)
 async def calculate_growth(request: CalculationRequest):
     """
     Perform linear and exponential growth calculations (instant, no streaming).
@@ -220,13 +287,6 @@ async def calculate_growth(request: CalculationRequest):
     Exponential: B^1, B^2, ..., B^E
     """
     try:
-        # Validate input
-        if request.base <= 0:
-            raise HTTPException(status_code=400, detail="Base must be positive")
-        
-        if request.exponent <= 0 or request.exponent > 100:
-            raise HTTPException(status_code=400, detail="Exponent must be between 1 and 100")
-        
         # Create calculation record
         started_at = datetime.utcnow()
         calculation_doc = {
@@ -236,10 +296,11 @@ async def calculate_growth(request: CalculationRequest):
             "started_at": started_at,
             "completed_at": None
         }
-        calc_result = calculations_collection.insert_one(calculation_doc)
-        calculation_id = str(calc_result.inserted_id)
+        calc_result = await calculations_collection.insert_one(calculation_doc)
+        calc_oid = calc_result.inserted_id
+        calculation_id = str(calc_oid)
         
-        log_event(calculation_id, "calculation_started", 
+        await log_event(calculation_id, "calculation_started", 
                  f"Starting calculation: base={request.base}, exponent={request.exponent}",
                  {"base": request.base, "exponent": request.exponent})
         
@@ -247,69 +308,84 @@ async def calculate_growth(request: CalculationRequest):
         exponential_logs = []
         
         # Perform calculations
+        linear_results, exponential_results = growth_sequences(request.base, request.exponent)
+        step_timestamp = datetime.utcnow().isoformat()
+        base_str = repr(request.base)
         for i in range(1, request.exponent + 1):
             # Linear
-            linear_result = request.base * i
-            linear_logs.append(StepLog(
-                step=i,
-                operation=f"{request.base} × {i}",
-                result=linear_result,
-                timestamp=datetime.utcnow().isoformat()
-            ))
+            linear_logs.append({
+                "step": i,
+                "operation": f"{base_str} × {i}",
+                "result": linear_results[i - 1],
+                "timestamp": step_timestamp
+            })
             
             # Exponential
-            exponential_result = math.pow(request.base, i)
-            exponential_logs.append(StepLog(
-                step=i,
-                operation=f"{request.base}^{i}",
-                result=exponential_result,
-                timestamp=datetime.utcnow().isoformat()
-            ))
+            exponential_logs.append({
+                "step": i,
+                "operation": f"{base_str}^{i}",
+                "result": exponential_results[i - 1],
+                "timestamp": step_timestamp
+            })
         
-        linear_final = request.base * request.exponent
-        exponential_final = math.pow(request.base, request.exponent)
+        linear_final = linear_results[-1]
+        exponential_final = exponential_results[-1]
         
         # Update calculation record
         completed_at = datetime.utcnow()
-        calculations_collection.update_one(
-            {"_id": ObjectId(calculation_id)},
-            {
-                "$set": {
-                    "status": "completed",
-                    "completed_at": completed_at,
-                    "linear_result": linear_final,
-                    "exponential_result": exponential_final,
-                    "total_steps": request.exponent
+        # The two writes touch different collections, so issue them concurrently
+        update_result, event_result = await asyncio.gather(
+            calculations_collection.update_one(
+                {"_id": calc_oid},
+                {
+                    "$set": {
+                        "status": "completed",
+                        "completed_at": completed_at,
+                        "linear_result": linear_final,
+                        "exponential_result": exponential_final,
+                        "total_steps": request.exponent
+                    }
                 }
-            }
+            ),
+            log_event(calculation_id, "calculation_completed", "Calculation completed successfully"),
+            return_exceptions=True
         )
+        if isinstance(update_result, Exception):
+            raise update_result
+        # The calculation is stored, so a lost completion event does not fail the request
+        if isinstance(event_result, Exception):
+            print(f"Warning: Failed to log event: {event_result}")
         
-        log_event(calculation_id, "calculation_completed", "Calculation completed successfully")
-        
-        return CalculationResponse(
-            calculation_id=calculation_id,
-            base=request.base,
-            exponent=request.exponent,
-            linear_result=linear_final,
-            exponential_result=exponential_final,
-            linear_logs=linear_logs,
-            exponential_logs=exponential_logs,
-            total_steps=request.exponent,
-            started_at=started_at.isoformat(),
-            completed_at=completed_at.isoformat()
-        )
+        # Returned directly so FastAPI skips re-validating against CalculationResponse,
+        # which is kept on the route for the OpenAPI schema
+        return ORJSONResponse(content={
+            "calculation_id": calculation_id,
+            "base": request.base,
+            "exponent": request.exponent,
+            "linear_result": linear_final,
+            "exponential_result": exponential_final,
+            "linear_logs": linear_logs,
+            "exponential_logs": exponential_logs,
+            "total_steps": request.exponent,
+            "started_at": started_at.isoformat(),
+            "completed_at": completed_at.isoformat()
+        })
         
     except HTTPException:
         raise
     except Exception as e:
-        log_event(calculation_id if 'calculation_id' in locals() else "unknown",
+        await log_event(calculation_id if 'calculation_id' in locals() else "unknown",
                  "calculation_error", f"Error: {str(e)}", {"error": str(e)})
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/calculations")
-async def get_calculations(limit: int = 10):
-    """Get recent calculations"""
-    calculations = list(calculations_collection.find().sort("started_at", -1).limit(limit))
+async def get_calculations(limit: int = Query(10, ge=1)):
+    """Get recent calculations (without their steps)"""
+    cursor = (calculations_collection.find({}, projection={"steps": 0})
+              .sort("started_at", -1)
+              .limit(limit)
+              .batch_size(limit))
+    calculations = await cursor.to_list(length=limit)
     
     for calc in calculations:
         calc["_id"] = str(calc["_id"])
@@ -322,20 +398,40 @@ async def get_calculations(limit: int = 10):
 
 @app.get("/api/events/{calculation_id}")
 async def get_calculation_events(calculation_id: str):
-    """Get all events for a specific calculation"""
-    events = list(events_collection.find({"calculation_id": calculation_id}).sort("timestamp", 1))
+    """
+    Get all events and recorded steps for a specific calculation.
+    `count` is the number of events; `step_count` is the number of steps.
+    Unknown ids return empty lists.
+    """
+    cursor = events_collection.find({"calculation_id": calculation_id}).sort("timestamp", 1)
+    if ObjectId.is_valid(calculation_id):
+        events, calculation = await asyncio.gather(
+            cursor.to_list(length=None),
+            calculations_collection.find_one({"_id": ObjectId(calculation_id)}, projection={"steps": 1})
+        )
+    else:
+        events, calculation = await cursor.to_list(length=None), None
     
     for event in events:
         event["_id"] = str(event["_id"])
         if event.get("timestamp"):
             event["timestamp"] = event["timestamp"].isoformat()
     
-    return {"events": events, "count": len(events)}
+    steps = calculation.get("steps", []) if calculation else []
+    for step in steps:
+        if step.get("timestamp"):
+            step["timestamp"] = step["timestamp"].isoformat()
+    
+    return {"events": events, "steps": steps, "count": len(events), "step_count": len(steps)}
 
 @app.get("/api/events")
-async def get_all_events(limit: int = 50):
-    """Get recent events"""
-    events = list(events_collection.find().sort("timestamp", -1).limit(limit))
+async def get_all_events(limit: int = Query(50, ge=1)):
+    """Get recent events (without their data payloads)"""
+    cursor = (events_collection.find({}, projection={"data": 0})
+              .sort("timestamp", -1)
+              .limit(limit)
+              .batch_size(limit))
+    events = await cursor.to_list(length=limit)
     
     for event in events:
         event["_id"] = str(event["_id"])
@@ -344,7 +440,7 @@ async def get_all_events(limit: int = 50):
     
     return {"events": events, "count": len(events)}
 
-def log_event(calculation_id: str, event_type: str, message: str, data: dict = None):
+async def log_event(calculation_id: str, event_type: str, message: str, data: dict = None):
     """Log an event to MongoDB"""
     event_doc = {
         "calculation_id": calculation_id,
@@ -353,8 +449,15 @@ def log_event(calculation_id: str, event_type: str, message: str, data: dict = N
         "timestamp": datetime.utcnow(),
         "data": data or {}
     }
-    events_collection.insert_one(event_doc)
+    await events_collection.insert_one(event_doc)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8080,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2))
+    )